@@ -1,4 +1,5 @@
-from typing import Dict
+from typing import Dict, Optional
+import weakref
 import numpy as np
 from dataclasses import dataclass, field
 from LoopStructural.utils import getLogger
@@ -14,6 +15,12 @@ class StructuredGrid:
     cell_properties: Dict[str, np.ndarray] = field(default_factory=dict)
     properties: Dict[str, np.ndarray] = field(default_factory=dict)
     name: str = "default_grid"
+    _vtk_cache: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_vtk_cache"] = None
+        return state
 
     def to_dict(self):
         return {
@@ -30,24 +37,56 @@ class StructuredGrid:
     def maximum(self):
         return self.origin + self.nsteps * self.step_vector
 
+    def _node_coordinates(self):
+        """Node coordinates along each axis
+
+        These match the locations of :meth:`BoundingBox.regular_grid`, which is
+        where the node properties are evaluated.
+        """
+        maximum = self.maximum
+        return [np.linspace(self.origin[i], maximum[i], self.nsteps[i]) for i in range(3)]
+
+    def _vtk_signature(self):
+        """Geometry and property arrays that the vtk grid is built from"""
+        return (
+            tuple(self.origin),
+            tuple(self.step_vector),
+            tuple(self.nsteps),
+            tuple((name, id(data), data.shape) for name, data in self.properties.items()),
+            tuple((name, id(data), data.shape) for name, data in self.cell_properties.items()),
+        )
+
     def vtk(self):
+        """Build a pyvista RectilinearGrid of the structured grid and its properties.
+        The grid is cached and reused until the geometry changes or a property array
+        is replaced, modifying a property array in place is not detected.
+
+        Returns
+        -------
+        pyvista.RectilinearGrid
+            shallow copy of the cached grid
+        """
         try:
             import pyvista as pv
         except ImportError:
             raise ImportError("pyvista is required for vtk support")
-        x = np.linspace(self.origin[0], self.maximum[0], self.nsteps[0])
-        y = np.linspace(self.origin[1], self.maximum[1], self.nsteps[1])
-        z = np.linspace(self.origin[2], self.maximum[2], self.nsteps[2])
-        grid = pv.RectilinearGrid(
-            x,
-            y,
-            z,
-        )
+        signature = self._vtk_signature()
+        if self._vtk_cache is not None:
+            cached_signature, refs, grid = self._vtk_cache
+            # the weak references make sure the ids belong to the same arrays
+            if cached_signature == signature and all(ref() is not None for ref in refs):
+                return grid.copy(deep=False)
+        grid = pv.RectilinearGrid(*self._node_coordinates())
         for name, data in self.properties.items():
             grid[name] = data.reshape((grid.n_points, -1), order="F")
         for name, data in self.cell_properties.items():
             grid.cell_data[name] = data.reshape((grid.n_cells, -1), order="F")
-        return grid
+        refs = [
+            weakref.ref(data)
+            for data in [*self.properties.values(), *self.cell_properties.values()]
+        ]
+        self._vtk_cache = (signature, refs, grid)
+        return grid.copy(deep=False)
 
     def plot(self, pyvista_kwargs={}):
         """Calls pyvista plot on the vtk object
@@ -85,10 +124,7 @@ class StructuredGrid:
 
     @property
     def nodes(self):
-        x = np.linspace(self.origin[0], self.maximum[0], self.nsteps[0])
-        y = np.linspace(self.origin[1], self.maximum[1], self.nsteps[1])
-        z = np.linspace(self.origin[2], self.maximum[2], self.nsteps[2])
-        x, y, z = np.meshgrid(x, y, z, indexing="ij")
+        x, y, z = np.meshgrid(*self._node_coordinates(), indexing="ij")
         return np.vstack([x.flatten(order='f'), y.flatten(order='f'), z.flatten(order='f')]).T
 
     def merge(self, other):
@@ -19,6 +19,9 @@ logger = getLogger(__name__)
 class DiscreteInterpolator(GeologicalInterpolator):
     """ """
 
+    # cached values that can be recomputed, these are not pickled
+    _cache_attributes = ("_region_cache", "_A_cache", "_b_cache", "_normal_equations_cache")
+
     def __init__(self, support, data={}, c=None, up_to_date=False):
         """
         Base class for a discrete interpolator e.g. piecewise linear or finite difference which is
@@ -33,12 +36,15 @@ class DiscreteInterpolator(GeologicalInterpolator):
         self.B = []
         self.support = support
         self.dimensions = support.dimension
+        if c is not None:
+            c = np.array(c)
         self.c = (
-            np.array(c)
-            if c is not None and np.array(c).shape[0] == self.support.n_nodes
+            c
+            if c is not None and c.shape[0] == self.support.n_nodes
             else np.zeros(self.support.n_nodes)
         )
         self.region_function = lambda xyz: np.ones(xyz.shape[0], dtype=bool)
+        self._region_cache = None
 
         self.shape = "rectangular"
         if self.shape == "square":
@@ -60,10 +66,28 @@ class DiscreteInterpolator(GeologicalInterpolator):
         self.non_linear_constraints = []
         self.constraints = {}
         self.interpolation_weights = {}
+        self._A_cache = None
+        self._b_cache = None
+        self._normal_equations_cache = None
         logger.info("Creating discrete interpolator with {} degrees of freedom".format(self.nx))
         self.type = InterpolatorType.BASE_DISCRETE
 
+    def __getstate__(self):
+        # the cached region and matrices are rebuilt when needed so don't
+        # store them when the interpolator is pickled
+        state = self.__dict__.copy()
+        for name in self._cache_attributes:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # interpolators pickled before the caches were added
+        for name in self._cache_attributes:
+            self.__dict__.setdefault(name, None)
+
     def set_nelements(self, nelements: int) -> int:
+        self._region_cache = None
         return self.support.set_nelements(nelements)
 
     @property
@@ -86,7 +110,7 @@ class DiscreteInterpolator(GeologicalInterpolator):
         int
             number of degrees of freedom, positve
         """
-        return len(self.support.nodes[self.region])
+        return self._get_region_cache()[2]
 
     @property
     def region(self) -> np.ndarray:
@@ -99,13 +123,44 @@ class DiscreteInterpolator(GeologicalInterpolator):
 
         """
 
-        return self.region_function(self.support.nodes).astype(bool)
+        return self._get_region_cache()[0]
 
     @property
-    def region_map(self):
-        region_map = np.zeros(self.support.n_nodes).astype(int)
-        region_map[self.region] = np.array(range(0, len(region_map[self.region])))
-        return region_map
+    def region_map(self) -> np.ndarray:
+        """Map from the support node index to the index of the node
+        in the interpolation region
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return self._get_region_cache()[1]
+
+    def _compute_region_map(self):
+        """Evaluate the region function on the support nodes
+
+        Returns
+        -------
+        region, region_map : np.ndarray
+            boolean mask of the nodes in the region and the region index of each node
+        nx : int
+            number of nodes in the region
+        """
+        region = self.region_function(self.support.nodes).astype(bool)
+        nx = int(np.count_nonzero(region))
+        region_map = np.zeros(self.support.n_nodes, dtype=int)
+        region_map[region] = np.arange(nx)
+        return region, region_map, nx
+
+    def _get_region_cache(self):
+        """The region, region map and number of degrees of freedom are cached
+        until the region is set, the interpolator is reset or the number of
+        nodes in the support changes
+        """
+        n_nodes = self.support.n_nodes
+        if self._region_cache is None or self._region_cache[0] != n_nodes:
+            self._region_cache = (n_nodes, *self._compute_region_map())
+        return self._region_cache[1:]
 
     def set_region(self, region=None):
         """
@@ -123,6 +178,7 @@ class DiscreteInterpolator(GeologicalInterpolator):
         # evaluate the region function on the support to determine
         # which nodes are inside update region map and degrees of freedom
         # self.region_function = region
+        self._region_cache = None
         logger.info(
             "Cannot use region at the moment. Interpolation now uses region and has {} degrees of freedom".format(
                 self.nx
@@ -145,13 +201,22 @@ class DiscreteInterpolator(GeologicalInterpolator):
         for key in weights:
             self.up_to_date = False
             self.interpolation_weights[key] = weights[key]
+        self._clear_matrix_cache()
+
+    def _clear_matrix_cache(self):
+        """
+        Discard the assembled interpolation matrix so that it is rebuilt
+        from the constraints the next time it is needed
+        """
+        self._A_cache = None
+        self._b_cache = None
+        self._normal_equations_cache = None
 
     def _pre_solve(self):
         """
         Pre solve function to be run before solving the interpolation
         """
-        self.c = np.zeros(self.support.n_nodes)
-        self.c[:] = np.nan
+        self.c = np.full(self.support.n_nodes, np.nan)
         return True
 
     def _post_solve(self):
@@ -167,6 +232,8 @@ class DiscreteInterpolator(GeologicalInterpolator):
         self.constraints = {}
         self.ineq_constraints = {}
         self.equal_constraints = {}
+        self.eq_const_c = 0
+        self._clear_matrix_cache()
 
     def reset(self):
         """
@@ -174,6 +241,10 @@ class DiscreteInterpolator(GeologicalInterpolator):
 
         """
         self.constraints = {}
+        self.equal_constraints = {}
+        self.eq_const_c = 0
+        self._clear_matrix_cache()
+        self._region_cache = None
         self.c_ = 0
         self.regularisation_scale = np.ones(self.nx)
         logger.info("Resetting interpolation constraints")
@@ -198,9 +269,10 @@ class DiscreteInterpolator(GeologicalInterpolator):
         list of constraint ids
 
         """
-        A = np.array(A)
-        B = np.array(B)
-        idc = np.array(idc)
+        A = np.asarray(A, dtype=np.float64)
+        # B is normalised in place so take a copy of the callers array
+        B = np.array(B, dtype=np.float64)
+        idc = np.asarray(idc)
         n_rows = A.shape[0]
         # logger.debug('Adding constraints to interpolator: {} {} {}'.format(A.shape[0]))
         # print(A.shape,B.shape,idc.shape)
@@ -218,14 +290,15 @@ class DiscreteInterpolator(GeologicalInterpolator):
             # w = w.reshape((A.shape[0]))
         # normalise by rows of A
         # Should this be done? It should make the solution more stable
-        length = np.linalg.norm(A, axis=1)
-        B[length > 0] /= length[length > 0]
+        length = np.einsum("ij,ij->i", A, A)
+        np.sqrt(length, out=length)
+        # rows containing nan have a nan length and are left as zeros
         # going to assume if any are nan they are all nan
-        mask = np.any(np.isnan(A), axis=1)
-        A[mask, :] = 0
-        A[length > 0, :] /= length[length > 0, None]
+        nonzero_length = length > 0
+        np.divide(B, length, out=B, where=nonzero_length)
+        A = np.divide(A, length[:, None], out=np.zeros_like(A), where=nonzero_length[:, None])
         if isinstance(w, (float, int)):
-            w = np.ones(A.shape[0]) * w
+            w = np.full(A.shape[0], w, dtype=np.float64)
         if not isinstance(w, np.ndarray):
             raise BaseException("w must be a numpy array")
 
@@ -234,7 +307,6 @@ class DiscreteInterpolator(GeologicalInterpolator):
         if np.any(np.isnan(idc)) or np.any(np.isnan(A)) or np.any(np.isnan(B)):
             logger.warning("Constraints contain nan not adding constraints: {}".format(name))
             # return
-        rows = np.arange(0, n_rows).astype(int)
         base_name = name
         while name in self.constraints:
             count = 0
@@ -242,13 +314,19 @@ class DiscreteInterpolator(GeologicalInterpolator):
                 count = int(name.split("_")[1]) + 1
             name = base_name + "_{}".format(count)
 
-        rows = np.tile(rows, (A.shape[-1], 1)).T
+        rows = np.broadcast_to(np.arange(n_rows)[:, None], A.shape)
+        # store the coefficients as flat triplets, the matrix is only assembled
+        # in build_matrix. Most of the regularisation operator entries are zero
+        # so these are not stored
+        nonzero = A != 0
+        self._clear_matrix_cache()
         self.constraints[name] = {
-            'matrix': sparse.coo_matrix(
-                (A.flatten(), (rows.flatten(), idc.flatten())), shape=(n_rows, self.nx)
-            ).tocsc(),
+            'rows': rows[nonzero],
+            'cols': idc[nonzero].astype(int),
+            'vals': A[nonzero],
             'b': B.flatten(),
             'w': w,
+            'nrows': n_rows,
         }
 
     @abstractmethod
@@ -263,14 +341,19 @@ class DiscreteInterpolator(GeologicalInterpolator):
 
         Returns
         -------
-        np.ndarray
-            vector of Ax-B
+        dict
+            vector of Ax-B for each constraint name
         """
         residuals = {}
-        for constraint_name, constraint in self.constraints:
+        for constraint_name, constraint in self.constraints.items():
+            # row wise sum of the stored coefficients times the node values
             residuals[constraint_name] = (
-                np.einsum("ij,ij->i", constraint["A"], self.c[constraint["idc"].astype(int)])
-                - constraint["B"].flatten()
+                np.bincount(
+                    constraint["rows"],
+                    weights=constraint["vals"] * self.c[constraint["cols"]],
+                    minlength=constraint["nrows"],
+                )
+                - constraint["b"]
             )
         return residuals
 
@@ -298,14 +381,14 @@ class DiscreteInterpolator(GeologicalInterpolator):
         gi[:] = -1
         gi[self.region] = np.arange(0, self.nx, dtype=int)
         idc = gi[idc]
-        rows = np.arange(0, idc.shape[0])
-        rows = np.tile(rows, (A.shape[-1], 1)).T
-
+        rows = np.broadcast_to(np.arange(idc.shape[0])[:, None], A.shape)
+        nonzero = A != 0
         self.ineq_constraints[name] = {
-            'matrix': sparse.coo_matrix(
-                (A.flatten(), (rows.flatten(), idc.flatten())), shape=(rows.shape[0], self.nx)
-            ).tocsc(),
+            'rows': rows[nonzero],
+            'cols': idc[nonzero],
+            'vals': A[nonzero],
             "bounds": bounds,
+            'nrows': idc.shape[0],
         }
 
     def add_value_inequality_constraints(self, w: float = 1.0):
@@ -313,8 +396,6 @@ class DiscreteInterpolator(GeologicalInterpolator):
         # check that we have added some points
         if points.shape[0] > 0:
             vertices, a, element, inside = self.support.get_element_for_location(points)
-            rows = np.arange(0, points[inside, :].shape[0], dtype=int)
-            rows = np.tile(rows, (a.shape[-1], 1)).T
             a = a[inside]
             cols = self.support.elements[element[inside]]
             self.add_inequality_constraints_to_matrix(a, points[:, 3:5], cols, 'inequality_value')
@@ -357,34 +438,24 @@ class DiscreteInterpolator(GeologicalInterpolator):
                     logger.warning(
                         f'Lower points not in mesh {lower_points[~lower_interpolation[3]]}'
                     )
-                ij = np.array(
-                    [
-                        *np.meshgrid(
-                            np.arange(0, int(upper_interpolation[3].sum()), dtype=int),
-                            np.arange(0, int(lower_interpolation[3].sum()), dtype=int),
-                        )
-                    ],
-                    dtype=int,
-                )
-
-                ij = ij.reshape(2, -1).T
-                rows = np.arange(0, ij.shape[0], dtype=int)
-                rows = np.tile(rows, (upper_interpolation[1].shape[-1], 1)).T
-                rows = np.hstack([rows, rows])
-                a = upper_interpolation[1][upper_interpolation[3]][ij[:, 0]]
-                a = np.hstack([a, -lower_interpolation[1][lower_interpolation[3]][ij[:, 1]]])
-                cols = np.hstack(
-                    [
-                        self.support.elements[
-                            upper_interpolation[2][upper_interpolation[3]][ij[:, 0]]
-                        ],
-                        self.support.elements[
-                            lower_interpolation[2][lower_interpolation[3]][ij[:, 1]]
-                        ],
-                    ]
-                )
-
-                bounds = np.zeros((ij.shape[0], 2))
+                upper_a = upper_interpolation[1][upper_interpolation[3]]
+                lower_a = lower_interpolation[1][lower_interpolation[3]]
+                upper_cols = self.support.elements[upper_interpolation[2][upper_interpolation[3]]]
+                lower_cols = self.support.elements[lower_interpolation[2][lower_interpolation[3]]]
+                n_upper, k = upper_a.shape
+                n_lower = lower_a.shape[0]
+                # one constraint for every combination of upper and lower point,
+                # filled by broadcasting rather than building the index pairs
+                a = np.empty((n_lower, n_upper, 2 * k))
+                a[:, :, :k] = upper_a[None, :, :]
+                np.negative(lower_a[:, None, :], out=a[:, :, k:])
+                cols = np.empty((n_lower, n_upper, 2 * k), dtype=int)
+                cols[:, :, :k] = upper_cols[None, :, :]
+                cols[:, :, k:] = lower_cols[:, None, :]
+                a = a.reshape(-1, 2 * k)
+                cols = cols.reshape(-1, 2 * k)
+
+                bounds = np.zeros((a.shape[0], 2))
                 bounds[:, 0] = lower_bound
                 bounds[:, 1] = upper_bound
 
@@ -457,7 +528,12 @@ class DiscreteInterpolator(GeologicalInterpolator):
         gi[self.region] = np.arange(0, self.nx)
         idc = gi[node_idx]
         outside = ~(idc == -1)
-
+        base_name = name
+        count = 0
+        while name in self.equal_constraints:
+            name = base_name + "_{}".format(count)
+            count += 1
+        self._clear_matrix_cache()
         self.equal_constraints[name] = {
             "A": np.ones(idc[outside].shape[0]),
             "B": values[outside],
@@ -496,72 +572,127 @@ class DiscreteInterpolator(GeologicalInterpolator):
         Returns
         -------
         Interpolation matrix and B
-        """
 
-        mats = []
+        Notes
+        -----
+        The assembled matrix is cached and reused until the constraints
+        or interpolation weights change
+        """
+        if self._A_cache is not None:
+            return self._A_cache, self._b_cache
+        rows = []
+        cols = []
+        vals = []
         bs = []
+        n_rows = 0
         for c in self.constraints.values():
             if len(c["w"]) == 0:
                 continue
-            mats.append(c['matrix'].multiply(c['w'][:, None]))
+            rows.append(c['rows'] + n_rows)
+            cols.append(c['cols'])
+            vals.append(c['vals'] * c['w'][c['rows']])
             bs.append(c['b'] * c['w'])
-        A = sparse.vstack(mats)
+            n_rows += c['nrows']
+        A = sparse.coo_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n_rows, self.nx),
+        ).tocsr()
         logger.info(f"Interpolation matrix is {A.shape[0]} x {A.shape[1]}")
 
         B = np.hstack(bs)
+        self._A_cache = A
+        self._b_cache = B
         return A, B
 
-    def add_equality_block(self, A, B):
-        if len(self.equal_constraints) > 0:
-            ATA = A.T.dot(A)
-            ATB = A.T.dot(B)
-            logger.info(f"Equality block is {self.eq_const_c} x {self.nx}")
-            # solving constrained least squares using
-            # | ATA CT | |c| = b
-            # | C   0  | |y|   d
-            # where A is the interpoaltion matrix
-            # C is the equality constraint matrix
-            # b is the interpolation constraints to be honoured
-            # in a least squares sense
-            # and d are the equality constraints
-            # c are the node values and y are the
-            # lagrange multipliers#
-            a = []
-            rows = []
-            cols = []
-            b = []
-            for c in self.equal_constraints.values():
-                b.extend((c["B"]).tolist())
-                aa = c["A"].flatten()
-                mask = aa == 0
-                a.extend(aa[~mask].tolist())
-                rows.extend(c["row"].flatten()[~mask].tolist())
-                cols.extend(c["col"].flatten()[~mask].tolist())
-
-            C = sparse.coo_matrix(
-                (np.array(a), (np.array(rows), cols)),
-                shape=(self.eq_const_c, self.nx),
-                dtype=float,
-            ).tocsr()
-
-            d = np.array(b)
-            ATA = sparse.bmat([[ATA, C.T], [C, None]])
-            ATB = np.hstack([ATB, d])
-
-            return ATA, ATB
+    def build_normal_equations(self):
+        """
+        Assemble the normal equations ATA x = ATB for the interpolation matrix.
+        These are cached alongside the interpolation matrix
+
+        Returns
+        -------
+        ATA, ATB
+            ATA is returned in csr format
+        """
+        if self._normal_equations_cache is None:
+            A, b = self.build_matrix()
+            # A.T is a csc view, the product needs both operands in the same
+            # format so convert once here. This keeps ATA in csr which is
+            # faster for the repeated matrix vector products in the solver
+            AT = A.T.tocsr()
+            self._normal_equations_cache = (AT @ A, AT @ b)
+        return self._normal_equations_cache
+
+    def build_equality_matrix(self):
+        """
+        Assemble the equality constraints into a matrix C and the values d
+        so that Cx = d
+
+        Returns
+        -------
+        C, d
+        """
+        constraints = self.equal_constraints.values()
+        if len(constraints) == 0:
+            return sparse.csr_matrix((0, self.nx), dtype=float), np.zeros(0)
+        a = np.concatenate([c["A"].ravel() for c in constraints])
+        rows = np.concatenate([c["row"].ravel() for c in constraints])
+        cols = np.concatenate([c["col"].ravel() for c in constraints]).astype(int)
+        d = np.concatenate([c["B"] for c in constraints])
+        mask = a != 0
+
+        C = sparse.coo_matrix(
+            (a[mask], (rows[mask], cols[mask])),
+            shape=(self.eq_const_c, self.nx),
+            dtype=float,
+        ).tocsr()
+        return C, d
 
     def build_inequality_matrix(self):
-        mats = []
+        rows = []
+        cols = []
+        vals = []
         bounds = []
+        n_rows = 0
         for c in self.ineq_constraints.values():
-            mats.append(c['matrix'])
+            rows.append(c['rows'] + n_rows)
+            cols.append(c['cols'])
+            vals.append(c['vals'])
             bounds.append(c['bounds'])
-        if len(mats) == 0:
+            n_rows += c['nrows']
+        if len(bounds) == 0:
             return sparse.csr_matrix((0, self.nx), dtype=float), np.zeros((0, 3))
-        Q = sparse.vstack(mats)
+        Q = sparse.coo_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n_rows, self.nx),
+        ).tocsr()
         bounds = np.vstack(bounds)
         return Q, bounds
 
+    def _equality_constrained_nodes(self):
+        """
+        Find the nodes that are fixed by the equality constraints
+
+        Returns
+        -------
+        free : np.ndarray
+            boolean mask of the nodes that are not fixed
+        x : np.ndarray
+            vector with the value of the fixed nodes and 0 for the free nodes
+        """
+        C, d = self.build_equality_matrix()
+        C = C.tocoo()
+        x = np.zeros(self.nx)
+        values = d[C.row]
+        x[C.col] = values
+        if np.any(~np.isclose(x[C.col], values)):
+            logger.warning(
+                "Nodes have conflicting equality constraints, using the last value added"
+            )
+        free = np.ones(self.nx, dtype=bool)
+        free[C.col] = False
+        return free, x
+
     def solve_system(
         self,
         solver: Optional[Union[Callable[[sparse.csr_matrix, np.ndarray], np.ndarray], str]] = None,
@@ -593,7 +724,9 @@ class DiscreteInterpolator(GeologicalInterpolator):
         Q, bounds = self.build_inequality_matrix()
         if callable(solver):
             logger.warning('Using custom solver')
-            self.c = solver(A.tocsr(), b)
+            if len(self.equal_constraints) > 0:
+                logger.warning("Equality constraints are not used by custom solvers")
+            self.c = solver(A, b)
             self.up_to_date = True
         elif isinstance(solver, str) or solver is None:
             if solver not in ['cg', 'lsmr', 'admm']:
@@ -601,6 +734,15 @@ class DiscreteInterpolator(GeologicalInterpolator):
                     f'Unknown solver {solver} using cg. \n Available solvers are cg and lsmr or a custom solver as a callable function'
                 )
                 solver = 'cg'
+        free = None
+        if len(self.equal_constraints) > 0 and solver in ['cg', 'lsmr']:
+            # every equality constraint fixes the value of a node, so rather than
+            # solving the indefinite KKT system these nodes are removed from the
+            # least squares problem
+            free, x = self._equality_constrained_nodes()
+            logger.info(f"Fixing {np.sum(~free)} nodes using equality constraints")
+            if 'x0' in solver_kwargs:
+                solver_kwargs = {**solver_kwargs, 'x0': solver_kwargs['x0'][free]}
         if solver == 'cg':
             logger.info("Solving using cg")
             if 'atol' not in solver_kwargs or 'rtol' not in solver_kwargs:
@@ -608,8 +750,19 @@ class DiscreteInterpolator(GeologicalInterpolator):
                     solver_kwargs['atol'] = tol
 
             logger.info(f"Solver kwargs: {solver_kwargs}")
-
-            res = sparse.linalg.cg(A.T @ A, A.T @ b, **solver_kwargs)
+            ATA, ATB = self.build_normal_equations()
+            if free is not None:
+                ATB = (ATB - ATA @ x)[free]
+                ATA = ATA[free][:, free]
+            if 'M' not in solver_kwargs:
+                # jacobi preconditioner, nodes without constraints have a zero diagonal
+                diag = ATA.diagonal()
+                diag[diag == 0] = 1.0
+                solver_kwargs = {'M': sparse.diags(1.0 / diag), **solver_kwargs}
+            res = sparse.linalg.cg(ATA, ATB, **solver_kwargs)
+            if free is not None:
+                x[free] = res[0]
+                res = (x, *res[1:])
             if res[1] > 0:
                 logger.warning(
                     f'CG reached iteration limit ({res[1]})and did not converge, check input data. Setting solution to last iteration'
@@ -626,7 +779,13 @@ class DiscreteInterpolator(GeologicalInterpolator):
                 if tol is not None:
                     solver_kwargs['btol'] = tol
             logger.info(f"Solver kwargs: {solver_kwargs}")
+            if free is not None:
+                b = b - A @ x
+                A = A[:, free]
             res = sparse.linalg.lsmr(A, b, **solver_kwargs)
+            if free is not None:
+                x[free] = res[0]
+                res = (x, *res[1:])
             if res[1] == 1 or res[1] == 4 or res[1] == 2 or res[1] == 5:
                 self.c = res[0]
             elif res[1] == 0:
@@ -643,6 +802,8 @@ class DiscreteInterpolator(GeologicalInterpolator):
 
         elif solver == 'admm':
             logger.info("Solving using admm")
+            if len(self.equal_constraints) > 0:
+                logger.warning("Equality constraints are not used by the admm solver")
 
             if 'x0' in solver_kwargs:
                 x0 = solver_kwargs['x0'](self.support)
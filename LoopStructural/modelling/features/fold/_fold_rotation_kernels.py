@@ -0,0 +1,57 @@
+"""
+Experimental numba kernels for the fold rotation angles. numba is not a
+dependency of LoopStructural, these are only used by FoldFrame when numba has
+been installed separately and there are enough points for the compiled kernels
+to be faster than the NumPy implementation.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True)
+def fold_axis_rotation_kernel(s1g, s1gyg, l1, out):
+    """
+    Fold axis rotation angle for each point, see FoldFrame.calculate_fold_axis_rotation.
+    The vectors do not need to be normalised
+    """
+    for i in prange(s1g.shape[0]):
+        sx, sy, sz = s1g[i, 0], s1g[i, 1], s1g[i, 2]
+        gx, gy, gz = s1gyg[i, 0], s1gyg[i, 1], s1gyg[i, 2]
+        lx, ly, lz = l1[i, 0], l1[i, 1], l1[i, 2]
+        ns = np.sqrt(sx * sx + sy * sy + sz * sz)
+        ng = np.sqrt(gx * gx + gy * gy + gz * gz)
+        nl = np.sqrt(lx * lx + ly * ly + lz * lz)
+        ls = (lx * sx + ly * sy + lz * sz) / (nl * ns)
+        gs = (gx * sx + gy * sy + gz * sz) / (ng * ns)
+        lg = (lx * gx + ly * gy + lz * gz) / (nl * ng)
+        far = np.rad2deg(np.arccos(lg - ls * gs)) - 90.0
+        if far > 90:
+            far -= 180.0
+        if far < -90:
+            far += 180.0
+        out[i] = far
+
+
+@njit(parallel=True, cache=True)
+def fold_limb_rotation_kernel(s1g, s0g, fold_axis, out):
+    """
+    Fold limb rotation angle for each point, see FoldFrame.calculate_fold_limb_rotation.
+    s1g and s0g must be unit vectors
+    """
+    for i in prange(s1g.shape[0]):
+        sx, sy, sz = s1g[i, 0], s1g[i, 1], s1g[i, 2]
+        ux, uy, uz = s0g[i, 0], s0g[i, 1], s0g[i, 2]
+        ax, ay, az = fold_axis[i, 0], fold_axis[i, 1], fold_axis[i, 2]
+        aa = ax * ax + ay * ay + az * az
+        as0 = ax * ux + ay * uy + az * uz
+        as1 = ax * sx + ay * sy + az * sz
+        r2 = (aa * (sx * ux + sy * uy + sz * uz) - as0 * as1) / np.sqrt(
+            (aa - as0 * as0) * (aa - as1 * as1)
+        )
+        flr = np.rad2deg(np.arcsin(r2))
+        # sign of the scalar triple product fold_axis . (s1g x s0g)
+        ds = ax * (sy * uz - sz * uy) + ay * (sz * ux - sx * uz) + az * (sx * uy - sy * ux)
+        if ds < 0:
+            flr *= -1
+        out[i] = flr
@@ -1,3 +1,5 @@
+import importlib.util
+
 import numpy as np
 
 from ....modelling.features._structural_frame import StructuralFrame
@@ -6,6 +8,66 @@ from ....utils import getLogger
 
 logger = getLogger(__name__)
 
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+# loading the compiled kernels takes ~0.2s even when they are cached, they
+# only save ~0.1us per point so below this the NumPy implementation is faster
+NUMBA_MIN_POINTS = 2_000_000
+
+
+def _numba_kernels(n_points):
+    """
+    Import the numba fold rotation angle kernels
+
+    Parameters
+    ----------
+    n_points : int
+        number of points the rotation angles are calculated for
+
+    Returns
+    -------
+    tuple or None
+        fold axis and fold limb rotation kernels, None if the NumPy
+        implementation should be used
+    """
+    global NUMBA_AVAILABLE
+    if not NUMBA_AVAILABLE or n_points < NUMBA_MIN_POINTS:
+        return None
+    try:
+        from ._fold_rotation_kernels import fold_axis_rotation_kernel, fold_limb_rotation_kernel
+    except ImportError as e:
+        # numba can be installed but fail to import e.g. unsupported numpy version
+        logger.warning(f"Cannot import numba, using numpy for fold rotation angles: {e}")
+        NUMBA_AVAILABLE = False
+        return None
+    return fold_axis_rotation_kernel, fold_limb_rotation_kernel
+
+
+def _cross3(a, b, out=None):
+    """
+    Row wise cross product of two Nx3 arrays, written column by column
+    to avoid the intermediate arrays created by np.cross
+
+    Parameters
+    ----------
+    a, b : np.ndarray
+        Nx3 arrays
+    out : np.ndarray, optional
+        Nx3 array to store the result in, must not be a or b
+
+    Returns
+    -------
+    np.ndarray
+        Nx3 array of a x b
+    """
+    if out is None:
+        out = np.empty((a.shape[0], 3))
+    scratch = np.empty(a.shape[0])
+    for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        np.multiply(a[:, j], b[:, k], out=out[:, i])
+        np.multiply(a[:, k], b[:, j], out=scratch)
+        np.subtract(out[:, i], scratch, out=out[:, i])
+    return out
+
 
 class FoldFrame(StructuralFrame):
     def __init__(self, name, features, fold=None, model=None):
@@ -20,6 +82,29 @@ class FoldFrame(StructuralFrame):
         """
         super().__init__(name, features, fold, model)
 
+    def _eval_frame(self, points):
+        """
+        Evaluate the normalised gradient of the first two fold frame coordinates
+        and normalise the observed vectors for the points
+
+        Parameters
+        ----------
+        points : np.ndarray
+            Nx6 array of locations and vectors
+
+        Returns
+        -------
+        s1g, s1gyg, l1 : np.ndarray
+            Nx3 arrays of unit vectors
+        """
+        s1g = self.features[0].evaluate_gradient(points[:, :3])
+        s1g /= np.linalg.norm(s1g, axis=1, keepdims=True)
+        s1gyg = self.features[1].evaluate_gradient(points[:, :3])
+        s1gyg /= np.linalg.norm(s1gyg, axis=1, keepdims=True)
+        l1 = points[:, 3:]
+        l1 /= np.linalg.norm(l1, axis=1, keepdims=True)
+        return s1g, s1gyg, l1
+
     def calculate_fold_axis_rotation(self, feature_builder, fold_axis=None):
         """
         Calculate the fold axis rotation angle by finding the angle between the
@@ -51,31 +136,36 @@ class FoldFrame(StructuralFrame):
         # in the restored space
         # self.features[0].faults_enabled = False
         # self.features[1].faults_enabled = False
-        s1g = self.features[0].evaluate_gradient(points[:, :3])
-        s1g /= np.linalg.norm(s1g, axis=1)[:, None]
-        s1gyg = self.features[1].evaluate_gradient(points[:, :3])
-        s1gyg /= np.linalg.norm(s1gyg, axis=1)[:, None]
-        l1 = points[:, 3:]
-        l1 /= np.linalg.norm(l1, axis=1)[:, None]
+        kernels = _numba_kernels(points.shape[0])
+        if kernels is not None:
+            fold_axis_rotation_kernel, _ = kernels
+            far = np.empty(points.shape[0])
+            fold_axis_rotation_kernel(
+                self.features[0].evaluate_gradient(points[:, :3]),
+                self.features[1].evaluate_gradient(points[:, :3]),
+                points[:, 3:],
+                far,
+            )
+            return far, self.features[1].evaluate_value(points[:, :3])
+        s1g, s1gyg, l1 = self._eval_frame(points)
         fad = self.features[1].evaluate_value(points[:, :3])
         # Turn the faults back on
         # self.features[0].faults_enabled = True
         # self.features[1].faults_enabled = True
 
-        # project s0 onto axis plane B X A X B
-        projected_l1 = np.cross(s1g, np.cross(l1, s1g, axisa=1, axisb=1), axisa=1, axisb=1)
-        projected_s1gyg = np.cross(s1g, np.cross(s1gyg, s1g, axisa=1, axisb=1), axisa=1, axisb=1)
-
-        # einsum dot product
-        far = np.einsum("ij,ij->i", projected_l1, projected_s1gyg)
-        far = np.rad2deg(np.arccos(far))
+        # project l1 and s1gyg onto the plane normal to s1g using
+        # B X A X B = A - (A.B)B for unit B, so the dot product of the
+        # projections is l1.s1gyg - (l1.s1g)(s1gyg.s1g)
+        far = np.einsum("ij,ij->i", l1, s1gyg)
+        far -= np.einsum("ij,ij->i", l1, s1g) * np.einsum("ij,ij->i", s1gyg, s1g)
+        np.arccos(far, out=far)
+        np.rad2deg(far, out=far)
         # scalar triple product
         # np.einsum("ij,ij->i", np.cross(l1, s1gyg, axisa=1, axisb=1), s1g)
         # check bounds
         far -= 90
         # far[stp < 0] = 360.- far[stp < 0]
-        far[far > 90] = far[far > 90] + -180
-        far[far < -90] = far[far < -90] + 180
+        far = np.where(far > 90, far - 180, np.where(far < -90, far + 180, far))
 
         return far, fad
 
@@ -116,12 +206,12 @@ class FoldFrame(StructuralFrame):
         # get the normals from the points array
         s0g = points[:, 3:]
 
-        s0g /= np.linalg.norm(s0g, axis=1)[:, None]
+        s0g /= np.linalg.norm(s0g, axis=1, keepdims=True)
         # calculate the gradient and value of the first coordinate of the
         # fold frame
         # for the locations and normalise
         s1g = self.features[0].evaluate_gradient(points[:, :3])
-        s1g /= np.linalg.norm(s1g, axis=1)[:, None]
+        s1g /= np.linalg.norm(s1g, axis=1, keepdims=True)
         s1 = self.features[0].evaluate_value(points[:, :3])
         # self.features[0].faults_enabled = True
         # self.features[1].faults_enabled = True
@@ -133,23 +223,26 @@ class FoldFrame(StructuralFrame):
             return np.rad2deg(np.arcsin(r2)), s1
         if axis is not None:
             fold_axis = axis(points[:, :3])
-            # project s0 onto axis plane B X A X B
-            projected_s0 = np.cross(
-                fold_axis, np.cross(s0g, fold_axis, axisa=1, axisb=1), axisa=1, axisb=1
-            )
-            projected_s1 = np.cross(
-                fold_axis, np.cross(s1g, fold_axis, axisa=1, axisb=1), axisa=1, axisb=1
-            )
-            projected_s0 /= np.linalg.norm(projected_s0, axis=1)[:, None]
-            projected_s1 /= np.linalg.norm(projected_s1, axis=1)[:, None]
-            r2 = np.einsum("ij,ij->i", projected_s1, projected_s0)  #
+            kernels = _numba_kernels(points.shape[0])
+            if kernels is not None:
+                _, fold_limb_rotation_kernel = kernels
+                flr = np.empty(points.shape[0])
+                fold_limb_rotation_kernel(s1g, s0g, fold_axis, flr)
+                return flr, s1
+            # project s0 and s1 onto axis plane B X A X B = A|B|^2 - B(A.B)
+            # the angle between the unit projections only needs the dot products
+            # of s0, s1 and the fold axis
+            aa = np.einsum("ij,ij->i", fold_axis, fold_axis)
+            as0 = np.einsum("ij,ij->i", fold_axis, s0g)
+            as1 = np.einsum("ij,ij->i", fold_axis, s1g)
+            r2 = aa * np.einsum("ij,ij->i", s1g, s0g) - as0 * as1
+            r2 /= np.sqrt((aa - as0 * as0) * (aa - as1 * as1))
             # adjust the fold rotation angle so that its always between -90
             # and 90
-            vv = np.cross(s1g, s0g, axisa=1, axisb=1)
-            ds = np.einsum("ij,ij->i", fold_axis, vv)
+            ds = np.einsum("ij,ij->i", fold_axis, _cross3(s1g, s0g))
             flr = np.rad2deg(np.arcsin(r2))  # np.where(ds > 0, np.rad2deg(np.arcsin(r2)),
             # (- )))
-            flr[ds < 0] *= -1
+            np.negative(flr, out=flr, where=ds < 0)
 
             # flr = np.where(flr < -90, (180. + flr), flr)
             # flr = np.where(flr > 90, -(180. - flr), flr)
@@ -184,11 +277,10 @@ class FoldFrame(StructuralFrame):
             logger.error("No points to calculate intersection lineation")
             raise ValueError("No data points associated with {}".format(feature_builder.name))
         points = np.vstack(points)
+        # l1 is normalised so the gradient does not need to be
         s1g = self.features[0].evaluate_gradient(points[:, :3])
-        s1g /= np.linalg.norm(points[:, :3], axis=1)[:, None]
         s0g = points[:, 3:]
-        s0g /= np.linalg.norm(s0g, axis=1)[:, None]
-        l1 = np.cross(s1g, s0g, axisa=1, axisb=1)
-        l1 /= np.linalg.norm(l1, axis=1)[:, None]
+        l1 = _cross3(s1g, s0g)
+        l1 /= np.linalg.norm(l1, axis=1, keepdims=True)
         self.features[0].faults_enabled = True
         return l1
@@ -77,6 +77,38 @@ def test_structured_grid_vtk():
     assert np.array_equal(vtk_grid['rng'], data['rng'].flatten(order="F"))
 
 
+def test_structured_grid_vtk_cache():
+    try:
+        import pyvista as pv  # noqa: F401
+    except ImportError:
+        pytest.skip("pyvista is required for vtk support")
+    values = rng.random(size=(10, 10, 10))
+    grid = StructuredGrid(
+        origin=np.array([0, 0, 0]),
+        step_vector=np.array([1, 1, 1]),
+        nsteps=np.array([10, 10, 10]),
+        properties={'rng': values},
+        cell_properties={},
+        name="grid_data",
+    )
+    vtk_grid = grid.vtk()
+    # adding arrays to the returned grid does not change the cached grid
+    vtk_grid['other'] = np.zeros(vtk_grid.n_points)
+    assert 'other' not in grid.vtk().array_names
+    assert np.array_equal(grid.vtk()['rng'], values.flatten(order="F"))
+    # replacing a property rebuilds the grid
+    grid.properties['rng'] = values * 2
+    assert np.array_equal(grid.vtk()['rng'], 2 * values.flatten(order="F"))
+
+
+def test_structured_grid_nodes_match_bounding_box():
+    from LoopStructural.datatypes import BoundingBox
+
+    bb = BoundingBox(origin=np.zeros(3), maximum=np.array([10, 20, 5]), nsteps=np.array([6, 11, 4]))
+    grid = bb.structured_grid()
+    assert np.allclose(grid.nodes, bb.regular_grid(local=False, order='F'))
+
+
 if __name__ == "__main__":
     test_structured_grid_to_dict()
     test_structured_grid_maximum()
@@ -1,3 +1,7 @@
+import numpy as np
+import pytest
+
+
 def test_nx(interpolator, data):
     assert interpolator.nx == 21 * 21 * 21
 
@@ -12,6 +16,119 @@ def test_region(interpolator, data, region_func):
     interpolator.solve_system()
 
 
+def test_region_cache(interpolator):
+    """The region is reused until the support changes"""
+    region = interpolator.region
+    assert interpolator.region is region
+    assert np.all(interpolator.region_map[region] == np.arange(interpolator.nx))
+    interpolator.set_nelements(1000)
+    assert interpolator.region.shape[0] == interpolator.support.n_nodes
+    assert interpolator.region_map.shape[0] == interpolator.support.n_nodes
+    assert interpolator.nx == np.count_nonzero(interpolator.region)
+
+
+def test_build_matrix_cache(interpolator, data):
+    """The assembled matrix is reused until the constraints change"""
+    interpolator.set_value_constraints(data[["X", "Y", "Z", "val", "w"]].to_numpy())
+    interpolator.setup_interpolator()
+    A, b = interpolator.build_matrix()
+    assert A.format == "csr"
+    assert interpolator.build_normal_equations()[0].format == "csr"
+    A_cached, b_cached = interpolator.build_matrix()
+    assert A is A_cached
+    assert b is b_cached
+    interpolator.add_value_constraints(1.0)
+    A_new, b_new = interpolator.build_matrix()
+    assert A_new is not A
+    assert A_new.shape[0] > A.shape[0]
+
+
+def test_pickle_without_cache(interpolator, data):
+    """The cached matrices are not pickled and old pickles without them load"""
+    interpolator.set_value_constraints(data[["X", "Y", "Z", "val", "w"]].to_numpy())
+    interpolator.setup_interpolator()
+    interpolator.build_normal_equations()
+    state = interpolator.__getstate__()
+    assert state["_A_cache"] is None
+    assert state["_normal_equations_cache"] is None
+    for name in ["_region_cache", "_A_cache", "_b_cache", "_normal_equations_cache"]:
+        del state[name]
+    old = type(interpolator).__new__(type(interpolator))
+    old.__setstate__(state)
+    assert old.nx == interpolator.nx
+    assert old.build_matrix()[0].shape == interpolator.build_matrix()[0].shape
+
+
+def test_pickle_round_trip(interpolator, data):
+    dill = pytest.importorskip("dill")
+    interpolator.set_value_constraints(data[["X", "Y", "Z", "val", "w"]].to_numpy())
+    interpolator.setup_interpolator()
+    interpolator.build_matrix()
+    loaded = dill.loads(dill.dumps(interpolator))
+    assert loaded._A_cache is None
+    assert loaded.nx == interpolator.nx
+
+
+def test_residual_for_constraints(interpolator):
+    """Residuals match the rows of the weighted interpolation matrix"""
+    xyz = np.random.default_rng(0).random((50, 3))
+    interpolator.set_value_constraints(np.hstack([xyz, xyz[:, :1], np.ones((50, 1))]))
+    interpolator.setup_interpolator()
+    interpolator.solve_system()
+    A, b = interpolator.build_matrix()
+    residuals = interpolator.calculate_residual_for_constraints()
+    assert set(residuals.keys()) == set(interpolator.constraints.keys())
+    weighted = [
+        residuals[name] * c["w"] for name, c in interpolator.constraints.items() if len(c["w"]) > 0
+    ]
+    assert np.allclose(np.hstack(weighted), A @ interpolator.c - b)
+
+
+def test_equality_constraints(interpolator):
+    """Equality constraints are honoured exactly by the solution"""
+    xyz = np.random.default_rng(0).random((50, 3))
+    interpolator.set_value_constraints(np.hstack([xyz, xyz[:, :1], np.ones((50, 1))]))
+    interpolator.setup_interpolator()
+    idc = np.arange(0, interpolator.support.n_nodes, 97)
+    values = np.full(idc.shape[0], 0.25)
+    interpolator.add_equality_constraints(idc, values)
+    interpolator.add_equality_constraints(idc + 1, values)
+    interpolator.solve_system()
+    assert np.allclose(interpolator.c[idc], values)
+    assert np.allclose(interpolator.c[idc + 1], values)
+
+
+def test_equality_constraints_rebuild(interpolator):
+    """Equality constraints are removed when the interpolator is set up again"""
+    xyz = np.random.default_rng(0).random((50, 3))
+    value_data = np.hstack([xyz, xyz[:, :1], np.ones((50, 1))])
+    interpolator.set_value_constraints(value_data)
+    interpolator.setup_interpolator()
+    interpolator.add_equality_constraints(np.arange(50), np.full(50, 0.25))
+    interpolator.solve_system()
+    interpolator.setup_interpolator()
+    interpolator.add_equality_constraints(np.arange(20), np.full(20, 0.75))
+    interpolator.solve_system()
+    assert np.allclose(interpolator.c[:20], 0.75)
+    assert not np.isclose(interpolator.c[30], 0.25)
+    # changing the resolution discards constraints for the old nodes
+    interpolator.add_equality_constraints(np.arange(500, 900), np.full(400, 0.25))
+    interpolator.set_nelements(200)
+    interpolator.setup_interpolator()
+    assert interpolator.solve_system('cg')
+    assert interpolator.c.shape[0] == interpolator.support.n_nodes
+
+
+def test_conflicting_equality_constraints(interpolator, caplog):
+    """A node constrained to two different values is reported"""
+    interpolator.setup_interpolator()
+    interpolator.add_equality_constraints(np.arange(10), np.full(10, 0.25))
+    interpolator.add_equality_constraints(np.arange(5), np.full(5, 0.75))
+    free, x = interpolator._equality_constrained_nodes()
+    assert np.count_nonzero(~free) == 10
+    assert "conflicting equality constraints" in caplog.text
+
+
 def test_add_constraint_to_least_squares(interpolator):
     """make sure that when incorrect sized arrays are passed it doesn't get added"""
     pass
@@ -0,0 +1,132 @@
+import sys
+
+import numpy as np
+import pytest
+
+from LoopStructural.modelling.features import LambdaGeologicalFeature
+from LoopStructural.modelling.features.fold import FoldFrame
+from LoopStructural.modelling.features.fold import _foldframe
+
+rng = np.random.default_rng(0)
+n_points = 50
+s1_gradient = rng.normal(size=(n_points, 3))
+s1gyg_gradient = rng.normal(size=(n_points, 3))
+fold_axis = rng.normal(size=(n_points, 3))
+observations = np.hstack([rng.random((n_points, 3)), rng.normal(size=(n_points, 3))])
+# degenerate rows, a nan gradient, a vector parallel to the frame gradient and
+# a zero fold axis
+s1_gradient[0, :] = np.nan
+observations[1, 3:] = s1_gradient[1, :] * 2
+fold_axis[2, :] = 0
+
+
+class FoldedFeatureBuilder:
+    name = "folded_feature"
+
+    def get_gradient_constraints(self):
+        return np.hstack([observations, np.ones((n_points, 1))])
+
+    def get_norm_constraints(self):
+        return np.zeros((0, 7))
+
+
+@pytest.fixture(params=[False, True], ids=["numpy", "numba"])
+def fold_frame(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numba")
+        monkeypatch.setattr(_foldframe, "NUMBA_MIN_POINTS", 0)
+    monkeypatch.setattr(_foldframe, "NUMBA_AVAILABLE", request.param)
+    features = [
+        LambdaGeologicalFeature(
+            lambda xyz: xyz[:, 0], name="s1", gradient_function=lambda xyz: s1_gradient
+        ),
+        LambdaGeologicalFeature(
+            lambda xyz: xyz[:, 1], name="s1gy", gradient_function=lambda xyz: s1gyg_gradient
+        ),
+        LambdaGeologicalFeature(lambda xyz: xyz[:, 2], name="s1gz"),
+    ]
+    return FoldFrame("fold_frame", features)
+
+
+def unit(v):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return v / np.linalg.norm(v, axis=1)[:, None]
+
+
+def test_fold_axis_rotation(fold_frame):
+    s1g = unit(s1_gradient)
+    s1gyg = unit(s1gyg_gradient)
+    l1 = unit(observations[:, 3:])
+    projected_l1 = np.cross(s1g, np.cross(l1, s1g))
+    projected_s1gyg = np.cross(s1g, np.cross(s1gyg, s1g))
+    expected = np.rad2deg(np.arccos(np.einsum("ij,ij->i", projected_l1, projected_s1gyg))) - 90
+    expected[expected > 90] -= 180
+    expected[expected < -90] += 180
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        far, fad = fold_frame.calculate_fold_axis_rotation(FoldedFeatureBuilder())
+    assert np.isnan(far[0])
+    assert np.allclose(far, expected, equal_nan=True)
+    assert np.allclose(fad, observations[:, 1])
+
+
+def test_fold_limb_rotation(fold_frame):
+    s0g = unit(observations[:, 3:])
+    s1g = unit(s1_gradient)
+    projected_s0 = unit(np.cross(fold_axis, np.cross(s0g, fold_axis)))
+    projected_s1 = unit(np.cross(fold_axis, np.cross(s1g, fold_axis)))
+    expected = np.rad2deg(np.arcsin(np.einsum("ij,ij->i", projected_s1, projected_s0)))
+    ds = np.einsum("ij,ij->i", fold_axis, np.cross(s1g, s0g))
+    expected[ds < 0] *= -1
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        flr, s1 = fold_frame.calculate_fold_limb_rotation(
+            FoldedFeatureBuilder(), axis=lambda xyz: fold_axis
+        )
+    assert np.isnan(flr[0])
+    assert np.isnan(flr[2])
+    assert np.allclose(flr, expected, equal_nan=True)
+    assert np.allclose(s1, observations[:, 0])
+
+
+def test_intersection_lineation(fold_frame):
+    expected = unit(np.cross(s1_gradient, observations[:, 3:]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        l1 = fold_frame.calculate_intersection_lineation(FoldedFeatureBuilder())
+    assert np.all(np.isnan(l1[[0, 1]]))
+    assert np.allclose(l1, expected, equal_nan=True)
+
+
+def test_numba_import_failure(monkeypatch, caplog):
+    """If numba is installed but cannot be imported the NumPy path is used"""
+    monkeypatch.setattr(_foldframe, "NUMBA_AVAILABLE", False)
+    features = [
+        LambdaGeologicalFeature(
+            lambda xyz: xyz[:, 0], name="s1", gradient_function=lambda xyz: s1_gradient
+        ),
+        LambdaGeologicalFeature(
+            lambda xyz: xyz[:, 1], name="s1gy", gradient_function=lambda xyz: s1gyg_gradient
+        ),
+        LambdaGeologicalFeature(lambda xyz: xyz[:, 2], name="s1gz"),
+    ]
+    frame = FoldFrame("fold_frame", features)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected_far, _ = frame.calculate_fold_axis_rotation(FoldedFeatureBuilder())
+        expected_flr, _ = frame.calculate_fold_limb_rotation(
+            FoldedFeatureBuilder(), axis=lambda xyz: fold_axis
+        )
+
+    monkeypatch.setitem(
+        sys.modules, "LoopStructural.modelling.features.fold._fold_rotation_kernels", None
+    )
+    monkeypatch.setattr(_foldframe, "NUMBA_AVAILABLE", True)
+    monkeypatch.setattr(_foldframe, "NUMBA_MIN_POINTS", 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        far, _ = frame.calculate_fold_axis_rotation(FoldedFeatureBuilder())
+        assert "Cannot import numba" in caplog.text
+        monkeypatch.setattr(_foldframe, "NUMBA_AVAILABLE", True)
+        flr, _ = frame.calculate_fold_limb_rotation(
+            FoldedFeatureBuilder(), axis=lambda xyz: fold_axis
+        )
+    assert np.allclose(far, expected_far, equal_nan=True)
+    assert np.allclose(flr, expected_flr, equal_nan=True)